@@ -113,18 +113,20 @@ def writebundle(cg, filename, bundletype):
             os.unlink(cleanup)
 
 def decompressor(fh, alg):
+    # compressed data is read in fixed size blocks, iterating over the
+    # file would split it at whatever bytes happen to look like newlines
     if alg == 'UN':
         return fh
     elif alg == 'GZ':
         def generator(f):
             zd = zlib.decompressobj()
-            for chunk in f:
+            for chunk in util.filechunkiter(f):
                 yield zd.decompress(chunk)
     elif alg == 'BZ':
         def generator(f):
             zd = bz2.BZ2Decompressor()
             zd.decompress("BZ")
-            for chunk in util.filechunkiter(f, 4096):
+            for chunk in util.filechunkiter(f):
                 yield zd.decompress(chunk)
     else:
         raise util.Abort("unknown bundle compression '%s'" % alg)
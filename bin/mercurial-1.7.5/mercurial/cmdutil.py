@@ -7,7 +7,7 @@
 
 from node import hex, nullid, nullrev, short
 from i18n import _
-import os, sys, errno, re, glob, tempfile
+import os, sys, errno, re, glob, tempfile, bisect
 import util, templater, patch, error, encoding, templatekw
 import match as matchmod
 import similar, revset, subrepo
@@ -17,6 +17,54 @@ revrangesep = ':'
 def parsealiases(cmd):
     return cmd.lstrip("^").split("|")
 
+# alias indexes of the command tables seen, by table identity, along
+# with the keys each was built from
+_aliasindexes = {}
+
+def _aliasindex(table):
+    """Return (index, order, names, debugnames, matches) for a table
+
+    index maps every command name and alias to the table keys carrying
+    it, order maps each key to its position in the table. names and
+    debugnames are the sorted names of normal and debug commands, for
+    prefix searches. matches remembers the keys found for a (command,
+    strict) pair. All are rebuilt when the keys of the table change.
+    """
+    # extensions may delete commands as well as add them, and a table id
+    # may be reused once the table is gone: compare the keys themselves,
+    # building a set of them is cheap next to parsing every alias
+    keys = frozenset(table)
+    cached = _aliasindexes.get(id(table))
+    if cached is not None and cached[0] == keys:
+        return cached[1]
+    index, order = {}, {}
+    names, debugnames = set(), set()
+    for i, e in enumerate(table.keys()):
+        order[e] = i
+        aliases = parsealiases(e)
+        for a in aliases:
+            index.setdefault(a, []).append(e)
+            if aliases[0].startswith("debug") or a.startswith("debug"):
+                debugnames.add(a)
+            else:
+                names.add(a)
+    if len(_aliasindexes) > 10:
+        # aliases and extensions make a few tables per process at most
+        _aliasindexes.clear()
+    aliasindex = (index, order, sorted(names), sorted(debugnames), {})
+    _aliasindexes[id(table)] = (keys, aliasindex)
+    return aliasindex
+
+def _prefixkeys(index, names, prefix):
+    """Return the set of keys with a name in names starting with prefix"""
+    # names starting with prefix sort right after it
+    keys = set()
+    i = bisect.bisect_left(names, prefix)
+    while i < len(names) and names[i].startswith(prefix):
+        keys.update(index[names[i]])
+        i += 1
+    return keys
+
 def findpossible(cmd, table, strict=False):
     """
     Return cmd -> (aliases, command table entry)
@@ -25,21 +73,47 @@ def findpossible(cmd, table, strict=False):
     """
     choice = {}
     debugchoice = {}
-    for e in table.keys():
-        aliases = parsealiases(e)
-        found = None
-        if cmd in aliases:
-            found = cmd
-        elif not strict:
-            for a in aliases:
-                if a.startswith(cmd):
-                    found = a
-                    break
-        if found is not None:
-            if aliases[0].startswith("debug") or found.startswith("debug"):
-                debugchoice[found] = (aliases, table[e])
-            else:
-                choice[found] = (aliases, table[e])
+
+    def examine(keys):
+        for e in keys:
+            aliases = parsealiases(e)
+            found = None
+            if cmd in aliases:
+                found = cmd
+            elif not strict:
+                for a in aliases:
+                    if a.startswith(cmd):
+                        found = a
+                        break
+            if found is not None:
+                if aliases[0].startswith("debug") or found.startswith("debug"):
+                    debugchoice[found] = (aliases, table[e])
+                else:
+                    choice[found] = (aliases, table[e])
+
+    # only keys with an alias equal to (or starting with) cmd can match,
+    # look at those alone, in table order
+    index, order, names, debugnames, matches = _aliasindex(table)
+    keys = matches.get((cmd, not strict))
+    if keys is not None:
+        examine(keys)
+    elif strict:
+        keys = index.get(cmd, [])
+        examine(keys)
+    else:
+        keys = sorted(_prefixkeys(index, names, cmd), key=order.get)
+        examine(keys)
+        if not choice:
+            # debug commands are only wanted when nothing else matches,
+            # look again with them, in table order
+            keys = _prefixkeys(index, debugnames, cmd).union(keys)
+            keys = sorted(keys, key=order.get)
+            debugchoice.clear()
+            examine(keys)
+    if (cmd, not strict) not in matches:
+        if len(matches) > 1000:
+            matches.clear()
+        matches[cmd, not strict] = keys
 
     if not choice and debugchoice:
         choice = debugchoice
@@ -177,6 +251,17 @@ def revrange(repo, revs):
 
     return l
 
+def lookuprevs(repo, revs):
+    """Return the nodes of a list of symbolic revisions, in order.
+
+    Each distinct name is only looked up once, which matters when repo
+    is remote and every lookup is a round trip."""
+    nodes = {}
+    for rev in revs:
+        if rev not in nodes:
+            nodes[rev] = repo.lookup(rev)
+    return [nodes[rev] for rev in revs]
+
 def make_filename(repo, pat, node,
                   total=None, seqno=None, revwidth=None, pathname=None):
     node_expander = {
@@ -748,16 +833,19 @@ class changeset_printer(object):
         self.footer = None
 
     def flush(self, rev):
+        out = ''
         if rev in self.header:
-            h = self.header[rev]
+            h = self.header.pop(rev)
             if h != self.lastheader:
                 self.lastheader = h
-                self.ui.write(h)
-            del self.header[rev]
-        if rev in self.hunk:
-            self.ui.write(self.hunk[rev])
-            del self.hunk[rev]
+                out = h
+        hunk = self.hunk.pop(rev, None)
+        if hunk is not None:
+            # header and changeset go out in a single write
+            self.ui.write(out + hunk)
             return 1
+        if out:
+            self.ui.write(out)
         return 0
 
     def close(self):
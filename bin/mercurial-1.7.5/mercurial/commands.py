@@ -8,10 +8,12 @@
 from node import hex, nullid, nullrev, short
 from lock import release
 from i18n import _, gettext
+from bisect import insort
 import os, re, sys, difflib, time, tempfile
 import hg, util, revlog, extensions, copies, error
 import patch, help, mdiff, url, encoding, templatekw, discovery
 import archival, changegroup, cmdutil, sshserver, hbisect, hgweb, hgweb.server
+import commandserver
 import merge as mergemod
 import minirst, revset
 import dagparser
@@ -581,7 +583,7 @@ def bundle(ui, repo, fname, dest=None, **opts):
         if dest:
             raise util.Abort(_("--base is incompatible with specifying "
                                "a destination"))
-        base = [repo.lookup(rev) for rev in base]
+        base = cmdutil.lookuprevs(repo, base)
         # create the right base
         # XXX: nodesbetween / changegroup* should be "fixed" instead
         o = []
@@ -589,7 +591,7 @@ def bundle(ui, repo, fname, dest=None, **opts):
         for n in base:
             has.update(repo.changelog.reachable(n))
         if revs:
-            revs = [repo.lookup(rev) for rev in revs]
+            revs = cmdutil.lookuprevs(repo, revs)
             visit = revs[:]
             has.difference_update(visit)
         else:
@@ -612,7 +614,7 @@ def bundle(ui, repo, fname, dest=None, **opts):
         other = hg.repository(hg.remoteui(repo, opts), dest)
         revs, checkout = hg.addbranchrevs(repo, other, branches, revs)
         if revs:
-            revs = [repo.lookup(rev) for rev in revs]
+            revs = cmdutil.lookuprevs(repo, revs)
         o = discovery.findoutgoing(repo, other, force=opts.get('force'))
 
     if not o:
@@ -1629,22 +1631,37 @@ def grep(ui, repo, pattern, *pats, **opts):
         sep = eol = '\0'
 
     getfile = util.lrucachefunc(repo.file)
+    # compiled once above, shared by every body scanned below
+    finditer = regexp.finditer
 
     def matchlines(body):
+        # one finditer sweep over the whole body; only the first match
+        # on each line is reported
         begin = 0
         linenum = 0
-        while True:
-            match = regexp.search(body, begin)
-            if not match:
-                break
-            mstart, mend = match.span()
-            linenum += body.count('\n', begin, mstart) + 1
-            lstart = body.rfind('\n', begin, mstart) + 1 or begin
-            begin = body.find('\n', mend) + 1 or len(body)
-            lend = begin - 1
-            yield linenum, mstart - lstart, mend - lstart, body[lstart:lend]
+        matchiter = finditer(body)
+        while matchiter:
+            for match in matchiter:
+                mstart, mend = match.span()
+                if mstart < begin:
+                    if mend <= begin:
+                        continue
+                    # match runs past the reported line, rescan from there
+                    matchiter = finditer(body, begin)
+                    break
+                linenum += body.count('\n', begin, mstart) + 1
+                lstart = body.rfind('\n', begin, mstart) + 1 or begin
+                begin = body.find('\n', mend) + 1 or len(body)
+                lend = begin - 1
+                yield linenum, mstart - lstart, mend - lstart, body[lstart:lend]
+                if begin == len(body):
+                    return
+            else:
+                matchiter = None
 
     class linestate(object):
+        __slots__ = ('line', 'linenum', 'colstart', 'colend')
+
         def __init__(self, line, linenum, colstart, colend):
             self.line = line
             self.linenum = linenum
@@ -1685,7 +1702,7 @@ def grep(ui, repo, pattern, *pats, **opts):
         rev = ctx.rev()
         datefunc = ui.quiet and util.shortdate or util.datestr
         found = False
-        filerevmatches = {}
+        filerevmatches = set()
         if opts.get('all'):
             iter = difflinestates(pstates, states)
         else:
@@ -1705,22 +1722,24 @@ def grep(ui, repo, pattern, *pats, **opts):
                 c = (fn, rev)
                 if c in filerevmatches:
                     continue
-                filerevmatches[c] = 1
+                filerevmatches.add(c)
             else:
                 before = l.line[:l.colstart]
                 match = l.line[l.colstart:l.colend]
                 after = l.line[l.colend:]
-            ui.write(sep.join(cols))
             if before is not None:
-                ui.write(sep + before)
+                ui.write(sep.join(cols) + sep + before)
                 ui.write(match, label='grep.match')
-                ui.write(after)
-            ui.write(eol)
+                ui.write(after + eol)
+            else:
+                ui.write(sep.join(cols) + eol)
             found = True
         return found
 
-    skip = {}
+    skip = set()
     revfiles = {}
+    refs = {}
+    shown = set()
     matchfn = cmdutil.match(repo, pats, opts)
     found = False
     follow = opts.get('follow')
@@ -1731,6 +1750,10 @@ def grep(ui, repo, pattern, *pats, **opts):
         parent = pctx.rev()
         matches.setdefault(rev, {})
         matches.setdefault(parent, {})
+        # states of rev are needed to display rev itself and each of its
+        # children, free them once all of those have been shown
+        for r in (rev, parent):
+            refs[r] = refs.get(r, 0) + 1
         files = revfiles.setdefault(rev, [])
         for fn in fns:
             flog = getfile(fn)
@@ -1745,15 +1768,16 @@ def grep(ui, repo, pattern, *pats, **opts):
                 copies.setdefault(rev, {})[fn] = copy
             if fn in skip:
                 if copy:
-                    skip[copy] = True
+                    skip.add(copy)
                 continue
-            files.append(fn)
+            insort(files, fn)
 
             if fn not in matches[rev]:
                 grepbody(fn, rev, flog.read(fnode))
 
+            # parent states are only compared against with --all
             pfn = copy or fn
-            if pfn not in matches[parent]:
+            if opts.get('all') and pfn not in matches[parent]:
                 try:
                     fnode = pctx.filenode(pfn)
                     grepbody(pfn, parent, flog.read(fnode))
@@ -1763,22 +1787,28 @@ def grep(ui, repo, pattern, *pats, **opts):
     for ctx in cmdutil.walkchangerevs(repo, matchfn, opts, prep):
         rev = ctx.rev()
         parent = ctx.parents()[0].rev()
-        for fn in sorted(revfiles.get(rev, [])):
+        for fn in revfiles.get(rev, []):
             states = matches[rev][fn]
             copy = copies.get(rev, {}).get(fn)
             if fn in skip:
                 if copy:
-                    skip[copy] = True
+                    skip.add(copy)
                 continue
             pstates = matches.get(parent, {}).get(copy or fn, [])
             if pstates or states:
                 r = display(fn, ctx, pstates, states)
                 found = found or r
                 if r and not opts.get('all'):
-                    skip[fn] = True
+                    skip.add(fn)
                     if copy:
-                        skip[copy] = True
-        del matches[rev]
+                        skip.add(copy)
+        shown.add(rev)
+        for r in (rev, parent):
+            refs[r] -= 1
+            # a parent not shown yet is kept for when the walk gets to it
+            if not refs[r] and r in shown:
+                del refs[r]
+                del matches[r]
         del revfiles[rev]
 
     return not found
@@ -1817,14 +1847,15 @@ def heads(ui, repo, *branchrevs, **opts):
         heads = [repo[h] for h in repo.heads(start)]
     else:
         heads = []
-        for b, ls in repo.branchmap().iteritems():
-            if start is None:
-                heads += [repo[h] for h in ls]
-                continue
+        if start is not None:
             startrev = repo.changelog.rev(start)
             descendants = set(repo.changelog.descendants(startrev))
             descendants.add(startrev)
             rev = repo.changelog.rev
+        for b, ls in repo.branchmap().iteritems():
+            if start is None:
+                heads += [repo[h] for h in ls]
+                continue
             heads += [repo[h] for h in ls if rev(h) in descendants]
 
     if branchrevs:
@@ -1851,12 +1882,20 @@ def heads(ui, repo, *branchrevs, **opts):
     if not heads:
         return 1
 
-    heads = sorted(heads, key=lambda x: -x.rev())
+    # revs are unique, so the contexts themselves are never compared
+    heads = [(-h.rev(), h) for h in heads]
+    heads.sort()
+    heads = [h for r, h in heads]
     displayer = cmdutil.show_changeset(ui, repo, opts)
     for ctx in heads:
         displayer.show(ctx)
     displayer.close()
 
+# command and extension summaries built by help_, keyed by the options,
+# loaded extensions, aliases and encoding that affect them
+_helplistcache = {}
+_helpextcache = {}
+
 def help_(ui, name=None, with_version=False, unknowncmd=False):
     """show help for a given topic or a help overview
 
@@ -1946,28 +1985,43 @@ def help_(ui, name=None, with_version=False, unknowncmd=False):
             addglobalopts(False)
 
     def helplist(header, select=None):
-        h = {}
-        cmds = {}
-        for c, e in table.iteritems():
-            f = c.split("|", 1)[0]
-            if select and not select(f):
-                continue
-            if (not select and name != 'shortlist' and
-                e[0].__module__ != __name__):
-                continue
-            if name == "shortlist" and not f.startswith("^"):
-                continue
-            f = f.lstrip("^")
-            if not ui.debugflag and f.startswith("debug"):
-                continue
-            doc = e[0].__doc__
-            if doc and 'DEPRECATED' in doc and not ui.verbose:
-                continue
-            doc = gettext(doc)
-            if not doc:
-                doc = _("(no help text available)")
-            h[f] = doc.splitlines()[0].rstrip()
-            cmds[f] = c.lstrip("^")
+        key = None
+        if not select:
+            # aliases can be redefined and the encoding changed between
+            # commands of a long-running process
+            key = (name == 'shortlist', ui.verbose, ui.debugflag, len(table),
+                   tuple([n for n, m in extensions.extensions()]),
+                   tuple(ui.configitems('alias')), encoding.encoding)
+        if key in _helplistcache:
+            h, cmds = _helplistcache[key]
+        else:
+            h = {}
+            cmds = {}
+            for c, e in table.iteritems():
+                f = c.split("|", 1)[0]
+                if select and not select(f):
+                    continue
+                if (not select and name != 'shortlist' and
+                    e[0].__module__ != __name__):
+                    continue
+                if name == "shortlist" and not f.startswith("^"):
+                    continue
+                f = f.lstrip("^")
+                if not ui.debugflag and f.startswith("debug"):
+                    continue
+                doc = e[0].__doc__
+                if doc and 'DEPRECATED' in doc and not ui.verbose:
+                    continue
+                if doc:
+                    # only the first line is shown, and gettext works
+                    # paragraph by paragraph, leave the rest untranslated
+                    doc = gettext(doc.split('\n\n', 1)[0])
+                if not doc:
+                    doc = _("(no help text available)")
+                h[f] = doc.splitlines()[0].rstrip()
+                cmds[f] = c.lstrip("^")
+            if key:
+                _helplistcache[key] = h, cmds
 
         if not h:
             ui.status(_('no commands defined\n'))
@@ -2080,7 +2134,11 @@ def help_(ui, name=None, with_version=False, unknowncmd=False):
 
         helplist(header)
         if name != 'shortlist':
-            exts, maxlength = extensions.enabled()
+            key = (tuple([n for n, m in extensions.extensions()]),
+                   encoding.encoding)
+            if key not in _helpextcache:
+                _helpextcache[key] = extensions.enabled()
+            exts, maxlength = _helpextcache[key]
             text = help.listexts(_('enabled extensions:'), exts, maxlength)
             if text:
                 ui.write("\n%s\n" % minirst.format(text, textwidth))
@@ -2192,7 +2250,9 @@ def identify(ui, repo, source=None,
         parents = ctx.parents()
         changed = False
         if default or id or num:
-            changed = util.any(repo.status())
+            # an uncommitted merge is always a change, no need to walk
+            # the working directory for it
+            changed = len(parents) > 1 or util.any(repo.status())
         if default or id:
             output = ["%s%s" % ('+'.join([hexfunc(p.node()) for p in parents]),
                                 (changed) and "+" or "")]
@@ -2206,21 +2266,28 @@ def identify(ui, repo, source=None,
         if num:
             output.append(str(ctx.rev()))
 
-    if repo.local() and default and not ui.quiet:
+    if repo.local():
+        # look the branch and tags up once for all the fields below
+        showdefault = default and not ui.quiet
         b = encoding.tolocal(ctx.branch())
-        if b != 'default':
-            output.append("(%s)" % b)
+        taglist = []
+        if showdefault or tags:
+            taglist = ctx.tags()
 
-        # multiple tags for a single parent separated by '/'
-        t = "/".join(ctx.tags())
-        if t:
-            output.append(t)
+        if showdefault:
+            if b != 'default':
+                output.append("(%s)" % b)
+
+            # multiple tags for a single parent separated by '/'
+            t = "/".join(taglist)
+            if t:
+                output.append(t)
 
-    if branch:
-        output.append(encoding.tolocal(ctx.branch()))
+        if branch:
+            output.append(b)
 
-    if tags:
-        output.extend(ctx.tags())
+        if tags:
+            output.extend(taglist)
 
     ui.write("%s\n" % ' '.join(output))
 
@@ -2501,35 +2568,54 @@ def log(ui, repo, *pats, **opts):
     branches = opts.get('branch', []) + opts.get('only_branch', [])
     opts['branch'] = [repo.lookupbranch(b) for b in branches]
 
+    # filters are the same for every revision, look them up only once
+    nomerges = opts.get('no_merges')
+    onlymerges = opts.get('only_merges')
+    onlybranches = opts.get('branch')
+    users = opts['user']
+    keywords = [kw.lower() for kw in opts.get('keyword') or []]
+    parentrevs = repo.changelog.parentrevs
+
+    # shared by all revisions so its rename cache is filled only once
+    getrenamed = None
+    if opts.get('copies'):
+        getrenamed = templatekw.getrenamedfn(repo, endrev=endrev)
+
     displayer = cmdutil.show_changeset(ui, repo, opts, True)
     def prep(ctx, fns):
         rev = ctx.rev()
-        parents = [p for p in repo.changelog.parentrevs(rev)
-                   if p != nullrev]
-        if opts.get('no_merges') and len(parents) == 2:
+        parents = [p for p in parentrevs(rev) if p != nullrev]
+        if nomerges and len(parents) == 2:
             return
-        if opts.get('only_merges') and len(parents) != 2:
+        if onlymerges and len(parents) != 2:
             return
-        if opts.get('branch') and ctx.branch() not in opts['branch']:
+        if onlybranches and ctx.branch() not in onlybranches:
             return
         if df and not df(ctx.date()[0]):
             return
-        if opts['user'] and not [k for k in opts['user']
-                                 if k.lower() in ctx.user().lower()]:
-            return
-        if opts.get('keyword'):
-            for k in [kw.lower() for kw in opts['keyword']]:
-                if (k in ctx.user().lower() or
-                    k in ctx.description().lower() or
-                    k in " ".join(ctx.files()).lower()):
+        if users:
+            user = ctx.user().lower()
+            if not [k for k in users if k.lower() in user]:
+                return
+        if keywords:
+            # try the cheap fields first, the file list is only joined
+            # when neither the user nor the description match
+            user = ctx.user().lower()
+            desc = ctx.description().lower()
+            files = None
+            for k in keywords:
+                if k in user or k in desc:
+                    break
+                if files is None:
+                    files = " ".join(ctx.files()).lower()
+                if k in files:
                     break
             else:
                 return
 
         copies = None
-        if opts.get('copies') and rev:
+        if getrenamed and rev:
             copies = []
-            getrenamed = templatekw.getrenamedfn(repo, endrev=endrev)
             for fn in ctx.files():
                 rename = getrenamed(fn, rev)
                 if rename:
@@ -2545,10 +2631,11 @@ def log(ui, repo, *pats, **opts):
 
         displayer.show(ctx, copies=copies, matchfn=revmatchfn)
 
+    flush = displayer.flush
     for ctx in cmdutil.walkchangerevs(repo, matchfn, opts, prep):
         if count == limit:
             break
-        if displayer.flush(ctx.rev()):
+        if flush(ctx.rev()):
             count += 1
     displayer.close()
 
@@ -2571,14 +2658,32 @@ def manifest(ui, repo, node=None, rev=None):
     if not node:
         node = rev
 
-    decor = {'l':'644 @ ', 'x':'755 * ', '':'644   '}
-    ctx = repo[node]
-    for f in ctx:
-        if ui.debugflag:
-            ui.write("%40s " % hex(ctx.manifest()[f]))
-        if ui.verbose:
-            ui.write(decor[ctx.flags(f)])
-        ui.write("%s\n" % f)
+    decor = {'l':'644 @ ', 'x':'755 * '}
+    plain = '644   '
+    mf = repo[node].manifest()
+    flags = mf.flags
+    debug, verbose = ui.debugflag, ui.verbose
+    # build whole lines and hand them to ui.write in batches
+    out = []
+    append = out.append
+    for f, n in sorted(mf.iteritems()):
+        if verbose:
+            # most files carry no flag
+            fl = flags(f)
+            d = fl and decor[fl] or plain
+        if debug and verbose:
+            append("%40s %s%s\n" % (hex(n), d, f))
+        elif debug:
+            append("%40s %s\n" % (hex(n), f))
+        elif verbose:
+            append("%s%s\n" % (d, f))
+        else:
+            append("%s\n" % f)
+        if len(out) >= 1024:
+            ui.write("".join(out))
+            del out[:]
+    if out:
+        ui.write("".join(out))
 
 def merge(ui, repo, node=None, **opts):
     """merge working directory with another revision
@@ -2609,10 +2714,11 @@ def merge(ui, repo, node=None, **opts):
     Returns 0 on success, 1 if there are unresolved files.
     """
 
-    if opts.get('rev') and node:
+    rev = opts.get('rev')
+    if rev and node:
         raise util.Abort(_("please specify just one revision"))
     if not node:
-        node = opts.get('rev')
+        node = rev
 
     if not node:
         branch = repo.changectx(None).branch()
@@ -2702,13 +2808,17 @@ def parents(ui, repo, file_=None, **opts):
             if not cp:
                 continue
             try:
-                filenodes.append(cp.filenode(file_))
+                fn = cp.filenode(file_)
             except error.LookupError:
-                pass
+                continue
+            # both parents often share the file revision
+            if fn not in filenodes:
+                filenodes.append(fn)
         if not filenodes:
             raise util.Abort(_("'%s' not found in manifest!") % file_)
         fl = repo.file(file_)
-        p = [repo.lookup(fl.linkrev(fl.rev(fn))) for fn in filenodes]
+        clnode = repo.changelog.node
+        p = [clnode(fl.linkrev(fl.rev(fn))) for fn in filenodes]
     else:
         p = [cp.node() for cp in ctx.parents()]
 
@@ -2744,12 +2854,12 @@ def paths(ui, repo, search=None):
     Returns 0 on success.
     """
     if search:
-        for name, path in ui.configitems("paths"):
-            if name == search:
-                ui.write("%s\n" % url.hidepassword(path))
-                return
-        ui.warn(_("not found!\n"))
-        return 1
+        path = ui.config("paths", search)
+        if path is None:
+            ui.warn(_("not found!\n"))
+            return 1
+        ui.write("%s\n" % url.hidepassword(path))
+        return
     else:
         for name, path in ui.configitems("paths"):
             ui.write("%s = %s\n" % (name, url.hidepassword(path)))
@@ -2793,7 +2903,7 @@ def pull(ui, repo, source="default", **opts):
     revs, checkout = hg.addbranchrevs(repo, other, branches, opts.get('rev'))
     if revs:
         try:
-            revs = [other.lookup(rev) for rev in revs]
+            revs = cmdutil.lookuprevs(other, revs)
         except error.CapabilityError:
             err = _("other repository doesn't support revision lookup, "
                     "so a rev cannot be specified.")
@@ -2843,19 +2953,20 @@ def push(ui, repo, dest=None, **opts):
     other = hg.repository(hg.remoteui(repo, opts), dest)
     ui.status(_('pushing to %s\n') % url.hidepassword(dest))
     if revs:
-        revs = [repo.lookup(rev) for rev in revs]
+        revs = cmdutil.lookuprevs(repo, revs)
 
+    force = opts.get('force')
     repo._subtoppath = dest
     try:
         # push subrepos depth-first for coherent ordering
         c = repo['']
         subs = c.substate # only repos that are committed
         for s in sorted(subs):
-            if not c.sub(s).push(opts.get('force')):
+            if not c.sub(s).push(force):
                 return False
     finally:
         del repo._subtoppath
-    r = repo.push(other, opts.get('force'), revs=revs,
+    r = repo.push(other, force, revs=revs,
                   newbranch=opts.get('new_branch'))
     return r == 0
 
@@ -2911,11 +3022,15 @@ def remove(ui, repo, *pats, **opts):
     m = cmdutil.match(repo, pats, opts)
     s = repo.status(match=m, clean=True)
     modified, added, deleted, clean = s[0], s[1], s[3], s[6]
+    rel = m.rel
 
+    dirstate = repo.dirstate
     for f in m.files():
-        if f not in repo.dirstate and not os.path.isdir(m.rel(f)):
-            ui.warn(_('not removing %s: file is untracked\n') % m.rel(f))
-            ret = 1
+        if f not in dirstate:
+            r = rel(f)
+            if not os.path.isdir(r):
+                ui.warn(_('not removing %s: file is untracked\n') % r)
+                ret = 1
 
     if force:
         remove, forget = modified + deleted + clean, added
@@ -2923,25 +3038,27 @@ def remove(ui, repo, *pats, **opts):
         remove, forget = deleted, []
         for f in modified + added + clean:
             ui.warn(_('not removing %s: file still exists (use -f'
-                      ' to force removal)\n') % m.rel(f))
+                      ' to force removal)\n') % rel(f))
             ret = 1
     else:
         remove, forget = deleted + clean, []
         for f in modified:
             ui.warn(_('not removing %s: file is modified (use -f'
-                      ' to force removal)\n') % m.rel(f))
+                      ' to force removal)\n') % rel(f))
             ret = 1
         for f in added:
             ui.warn(_('not removing %s: file has been marked for add (use -f'
-                      ' to force removal)\n') % m.rel(f))
+                      ' to force removal)\n') % rel(f))
             ret = 1
 
+    verbose, exact = ui.verbose, m.exact
     for f in sorted(remove + forget):
-        if ui.verbose or not m.exact(f):
-            ui.status(_('removing %s\n') % m.rel(f))
+        if verbose or not exact(f):
+            ui.status(_('removing %s\n') % rel(f))
 
-    repo[None].forget(forget)
-    repo[None].remove(remove, unlink=not after)
+    wctx = repo[None]
+    wctx.forget(forget)
+    wctx.remove(remove, unlink=not after)
     return ret
 
 def rename(ui, repo, *pats, **opts):
@@ -3015,39 +3132,47 @@ def resolve(ui, repo, *pats, **opts):
 
     ms = mergemod.mergestate(repo)
     m = cmdutil.match(repo, pats, opts)
-    ret = 0
 
-    for f in ms:
-        if m(f):
-            if show:
-                if nostatus:
-                    ui.write("%s\n" % f)
-                else:
-                    ui.write("%s %s\n" % (ms[f].upper(), f),
-                             label='resolve.' +
-                             {'u': 'unresolved', 'r': 'resolved'}[ms[f]])
-            elif mark:
-                ms.mark(f, "r")
-            elif unmark:
-                ms.mark(f, "u")
-            else:
-                wctx = repo[None]
-                mctx = wctx.parents()[-1]
+    if show:
+        # read-only listing, the merge state is left untouched
+        if nostatus:
+            ui.write("".join(["%s\n" % f for f in ms if m(f)]))
+            return 0
+        labels = {'u': 'resolve.unresolved', 'r': 'resolve.resolved'}
+        for f in ms:
+            if m(f):
+                s = ms[f]
+                ui.write("%s %s\n" % (s.upper(), f), label=labels[s])
+        return 0
+
+    if mark or unmark:
+        state = mark and "r" or "u"
+        markfile = ms.mark
+        for f in ms:
+            if m(f):
+                markfile(f, state)
+        ms.commit()
+        return 0
 
+    ret = 0
+    wctx = repo[None]
+    mctx = wctx.parents()[-1]
+    ui.setconfig('ui', 'forcemerge', opts.get('tool', ''))
+    try:
+        for f in ms:
+            if m(f):
                 # backup pre-resolve (merge uses .orig for its own purposes)
                 a = repo.wjoin(f)
                 util.copyfile(a, a + ".resolve")
 
-                try:
-                    # resolve file
-                    ui.setconfig('ui', 'forcemerge', opts.get('tool', ''))
-                    if ms.resolve(f, wctx, mctx):
-                        ret = 1
-                finally:
-                    ui.setconfig('ui', 'forcemerge', '')
+                # resolve file
+                if ms.resolve(f, wctx, mctx):
+                    ret = 1
 
                 # replace filemerge's .orig file with our resolve file
                 util.rename(a + ".resolve", a + ".orig")
+    finally:
+        ui.setconfig('ui', 'forcemerge', '')
 
     ms.commit()
     return ret
@@ -3122,30 +3247,53 @@ def revert(ui, repo, *pats, **opts):
 
     wlock = repo.wlock()
     try:
+        dirstate = repo.dirstate
+        wjoin = repo.wjoin
+
         # walk dirstate.
 
         m = cmdutil.match(repo, pats, opts)
         m.bad = lambda x, y: False
+        mrel, mexact = m.rel, m.exact
         for abs in repo.walk(m):
-            names[abs] = m.rel(abs), m.exact(abs)
+            names[abs] = mrel(abs), mexact(abs)
 
         # walk target manifest.
 
+        namedirs = []
         def badfn(path, msg):
             if path in names:
                 return
-            path_ = path + '/'
-            for f in names:
-                if f.startswith(path_):
-                    return
-            ui.warn("%s: %s\n" % (m.rel(path), msg))
+            if not namedirs:
+                # directories holding any of the names, built on first use
+                dirs = set()
+                for f in names:
+                    pos = f.rfind('/')
+                    while pos != -1:
+                        d = f[:pos]
+                        if d in dirs:
+                            break
+                        dirs.add(d)
+                        pos = f.rfind('/', 0, pos)
+                namedirs.append(dirs)
+            if path in namedirs[0]:
+                return
+            ui.warn("%s: %s\n" % (mrel(path), msg))
 
-        m = cmdutil.match(repo, pats, opts)
+        # same patterns, only the reporting of bad files changes
         m.bad = badfn
-        for abs in repo[node].walk(m):
+        files = m.files()
+        if files and not m.anypats() and util.all([f in mf for f in files]):
+            # only names of files in the target manifest were given,
+            # no need to scan the whole manifest for them
+            targetnames = files
+        else:
+            targetnames = ctx.walk(m)
+        for abs in targetnames:
             if abs not in names:
-                names[abs] = m.rel(abs), m.exact(abs)
+                names[abs] = mrel(abs), mexact(abs)
 
+        # exact matcher, builds no regexps
         m = cmdutil.matchfiles(repo, names)
         changes = repo.status(match=m)[:4]
         modified, added, removed, deleted = map(set, changes)
@@ -3153,13 +3301,13 @@ def revert(ui, repo, *pats, **opts):
         # if f is a rename, also revert the source
         cwd = repo.getcwd()
         for f in added:
-            src = repo.dirstate.copied(f)
-            if src and src not in names and repo.dirstate[src] == 'r':
+            src = dirstate.copied(f)
+            if src and src not in names and dirstate[src] == 'r':
                 removed.add(src)
                 names[src] = (repo.pathto(src, cwd), True)
 
         def removeforget(abs):
-            if repo.dirstate[abs] == 'a':
+            if dirstate[abs] == 'a':
                 return _('forgetting %s\n')
             return _('removing %s\n')
 
@@ -3181,9 +3329,16 @@ def revert(ui, repo, *pats, **opts):
             (deleted, revert, remove, False, False),
             )
 
+        # file -> its disptable actions, so each file needs a single lookup
+        dispatch = {}
+        for table, hitlist, misslist, backuphit, backupmiss in disptable:
+            for f in table:
+                dispatch.setdefault(f, (hitlist, misslist, backuphit,
+                                        backupmiss))
+
         for abs, (rel, exact) in sorted(names.items()):
             mfentry = mf.get(abs)
-            target = repo.wjoin(abs)
+            target = wjoin(abs)
             def handle(xlist, dobackup):
                 xlist[0].append(abs)
                 if (dobackup and not opts.get('no_backup') and
@@ -3198,57 +3353,59 @@ def revert(ui, repo, *pats, **opts):
                     if not isinstance(msg, basestring):
                         msg = msg(abs)
                     ui.status(msg % rel)
-            for table, hitlist, misslist, backuphit, backupmiss in disptable:
-                if abs not in table:
-                    continue
+            entry = dispatch.get(abs)
+            if entry:
+                hitlist, misslist, backuphit, backupmiss = entry
                 # file has changed in dirstate
                 if mfentry:
                     handle(hitlist, backuphit)
                 elif misslist is not None:
                     handle(misslist, backupmiss)
-                break
-            else:
-                if abs not in repo.dirstate:
-                    if mfentry:
-                        handle(add, True)
-                    elif exact:
-                        ui.warn(_('file not managed: %s\n') % rel)
-                    continue
-                # file has not changed in dirstate
-                if node == parent:
-                    if exact:
-                        ui.warn(_('no changes needed to %s\n') % rel)
-                    continue
-                if pmf is None:
-                    # only need parent manifest in this unlikely case,
-                    # so do not read by default
-                    pmf = repo[parent].manifest()
-                if abs in pmf:
-                    if mfentry:
-                        # if version of file is same in parent and target
-                        # manifests, do nothing
-                        if (pmf[abs] != mfentry or
-                            pmf.flags(abs) != mf.flags(abs)):
-                            handle(revert, False)
-                    else:
-                        handle(remove, False)
+                continue
+            if abs not in dirstate:
+                if mfentry:
+                    handle(add, True)
+                elif exact:
+                    ui.warn(_('file not managed: %s\n') % rel)
+                continue
+            # file has not changed in dirstate
+            if node == parent:
+                if exact:
+                    ui.warn(_('no changes needed to %s\n') % rel)
+                continue
+            if pmf is None:
+                # only need parent manifest in this unlikely case,
+                # so do not read by default
+                pmf = repo[parent].manifest()
+            if abs in pmf:
+                if mfentry:
+                    # if version of file is same in parent and target
+                    # manifests, do nothing
+                    if (pmf[abs] != mfentry or
+                        pmf.flags(abs) != mf.flags(abs)):
+                        handle(revert, False)
+                else:
+                    handle(remove, False)
 
         if not opts.get('dry_run'):
+            wwrite = repo.wwrite
             def checkout(f):
                 fc = ctx[f]
-                repo.wwrite(f, fc.data(), fc.flags())
+                wwrite(f, fc.data(), fc.flags())
 
             audit_path = util.path_auditor(repo.root)
+            unlink = util.unlink
+            forget, remove_ = dirstate.forget, dirstate.remove
             for f in remove[0]:
-                if repo.dirstate[f] == 'a':
-                    repo.dirstate.forget(f)
+                if dirstate[f] == 'a':
+                    forget(f)
                     continue
                 audit_path(f)
                 try:
-                    util.unlink(repo.wjoin(f))
+                    unlink(wjoin(f))
                 except OSError:
                     pass
-                repo.dirstate.remove(f)
+                remove_(f)
 
             normal = None
             if node == parent:
@@ -3256,21 +3413,22 @@ def revert(ui, repo, *pats, **opts):
                 # to report the file as clean. We have to use normallookup for
                 # merges to avoid losing information about merged/dirty files.
                 if p2 != nullid:
-                    normal = repo.dirstate.normallookup
+                    normal = dirstate.normallookup
                 else:
-                    normal = repo.dirstate.normal
+                    normal = dirstate.normal
             for f in revert[0]:
                 checkout(f)
                 if normal:
                     normal(f)
 
+            add_ = dirstate.add
             for f in add[0]:
                 checkout(f)
-                repo.dirstate.add(f)
+                add_(f)
 
-            normal = repo.dirstate.normallookup
+            normal = dirstate.normallookup
             if node == parent and p2 == nullid:
-                normal = repo.dirstate.normal
+                normal = dirstate.normal
             for f in undelete[0]:
                 checkout(f)
                 normal(f)
@@ -3350,20 +3508,25 @@ def serve(ui, repo, **opts):
         s = sshserver.sshserver(ui, repo)
         s.serve_forever()
 
+    if opts["cmdserver"]:
+        s = commandserver.server(ui, repo, opts["cmdserver"])
+        return s.serve()
+
     # this way we can check if something was given in the command-line
     if opts.get('port'):
         opts['port'] = util.getport(opts.get('port'))
 
     baseui = repo and repo.baseui or ui
-    optlist = ("name templates style address port prefix ipv6"
-               " accesslog errorlog certificate encoding")
-    for o in optlist.split():
+    uis = [baseui]
+    if repo and repo.ui != baseui:
+        uis.append(repo.ui)
+    for o in ('name', 'templates', 'style', 'address', 'port', 'prefix',
+              'ipv6', 'accesslog', 'errorlog', 'certificate', 'encoding'):
         val = opts.get(o, '')
         if val in (None, ''): # should check against default options instead
             continue
-        baseui.setconfig("web", o, val)
-        if repo and repo.ui != baseui:
-            repo.ui.setconfig("web", o, val)
+        for u in uis:
+            u.setconfig("web", o, val)
 
     o = opts.get('web_conf') or opts.get('webdir_conf')
     if not o:
@@ -3473,11 +3636,11 @@ def status(ui, repo, *pats, **opts):
         show += ui.quiet and (states[:4] + ['clean']) or states
     if not show:
         show = ui.quiet and states[:4] or states[:5]
+    show = set(show)
 
     stat = repo.status(node1, node2, cmdutil.match(repo, pats, opts),
                        'ignored' in show, 'clean' in show, 'unknown' in show,
                        opts.get('subrepos'))
-    changestates = zip(states, 'MAR!?IC', stat)
 
     if (opts.get('all') or opts.get('copies')) and not opts.get('no_status'):
         ctxn = repo[nullid]
@@ -3493,18 +3656,40 @@ def status(ui, repo, *pats, **opts):
             elif v in added:
                 copy[v] = k
 
-    for state, char, files in changestates:
+    pathto = repo.pathto
+    if copy:
+        # rename sources are shown twice, as removed and as copy source
+        pathto = util.cachefunc(pathto)
+    changestates = []
+    for state, char, files in zip(states, 'MAR!?IC', stat):
         if state in show:
             format = "%s %%s%s" % (char, end)
             if opts.get('no_status'):
                 format = "%%s%s" % end
+            changestates.append(('status.' + state, format, files))
 
+    for label, format, files in changestates:
+        if end != '\n':
+            # color only splits labeled text on newlines, write each NUL
+            # terminated entry on its own so every entry is styled
             for f in files:
-                ui.write(format % repo.pathto(f, cwd),
-                         label='status.' + state)
+                ui.write(format % pathto(f, cwd), label=label)
                 if f in copy:
-                    ui.write('  %s%s' % (repo.pathto(copy[f], cwd), end),
+                    ui.write('  %s%s' % (pathto(copy[f], cwd), end),
                              label='status.copied')
+            continue
+        # write runs of lines sharing a label at once, copy sources
+        # are labeled differently and break a run
+        out = []
+        for f in files:
+            out.append(format % pathto(f, cwd))
+            if f in copy:
+                ui.write(''.join(out), label=label)
+                out = []
+                ui.write('  %s%s' % (pathto(copy[f], cwd), end),
+                         label='status.copied')
+        if out:
+            ui.write(''.join(out), label=label)
 
 def summary(ui, repo, **opts):
     """summarize working directory state
@@ -3546,23 +3731,29 @@ def summary(ui, repo, **opts):
     else:
         ui.status(m, label='log.branch')
 
-    st = list(repo.status(unknown=True))[:6]
+    st = list(repo.status(ignored=False, clean=False, unknown=True)[:6])
 
     c = repo.dirstate.copies()
     copied, renamed = [], []
-    for d, s in c.iteritems():
-        if s in st[2]:
-            st[2].remove(s)
-            renamed.append(d)
-        else:
-            copied.append(d)
-        if d in st[1]:
-            st[1].remove(d)
+    if c:
+        added, removed = set(st[1]), set(st[2])
+        for d, s in c.iteritems():
+            if s in removed:
+                removed.discard(s)
+                renamed.append(d)
+            else:
+                copied.append(d)
+            added.discard(d)
+        st[1], st[2] = list(added), list(removed)
     st.insert(3, renamed)
     st.insert(4, copied)
 
-    ms = mergemod.mergestate(repo)
-    st.append([f for f in ms if ms[f] == 'u'])
+    unresolved = []
+    # no merge in progress is the common case, skip reading merge state
+    if os.path.exists(repo.join('merge/state')):
+        ms = mergemod.mergestate(repo)
+        unresolved = [f for f in ms if ms[f] == 'u']
+    st.append(unresolved)
 
     subs = [s for s in ctx.substate if ctx.sub(s).dirty()]
     st.append(subs)
@@ -3590,7 +3781,9 @@ def summary(ui, repo, **opts):
     elif branch != parents[0].branch():
         t += _(' (new branch)')
     elif (parents[0].extra().get('close') and
-          pnode in repo.branchheads(branch, closed=True)):
+          pnode in repo.branchmap().get(branch, [])):
+        # closed heads are left out of bheads, but the unfiltered
+        # branch cache has them without reading any changesets
         t += _(' (head closed)')
     elif not (st[0] or st[1] or st[2] or st[3] or st[4] or st[9]):
         t += _(' (clean)')
@@ -3603,19 +3796,11 @@ def summary(ui, repo, **opts):
     else:
         ui.write(_('commit: %s\n') % t.strip())
 
-    # all ancestors of branch heads - all ancestors of parent = new csets
-    new = [0] * len(repo)
-    cl = repo.changelog
-    for a in [cl.rev(n) for n in bheads]:
-        new[a] = 1
-    for a in cl.ancestors(*[cl.rev(n) for n in bheads]):
-        new[a] = 1
-    for a in [p.rev() for p in parents]:
-        if a >= 0:
-            new[a] = 0
-    for a in cl.ancestors(*[p.rev() for p in parents]):
-        new[a] = 0
-    new = sum(new)
+    # all ancestors of branch heads - all ancestors of parent = new csets,
+    # findmissing still collects every ancestor of the parents first, only
+    # the walk from the heads stops early
+    new = len(repo.changelog.findmissing(common=[p.node() for p in parents],
+                                         heads=bheads))
 
     if new == 0:
         ui.status(_('update: (current)\n'))
@@ -3639,10 +3824,15 @@ def summary(ui, repo, **opts):
 
         dest, branches = hg.parseurl(ui.expandpath('default-push', 'default'))
         revs, checkout = hg.addbranchrevs(repo, repo, branches, None)
-        other = hg.repository(hg.remoteui(repo, {}), dest)
-        ui.debug('comparing with %s\n' % url.hidepassword(dest))
+        if dest == source:
+            # same peer, what it has in common with us is already known
+            base = common
+        else:
+            other = hg.repository(hg.remoteui(repo, {}), dest)
+            ui.debug('comparing with %s\n' % url.hidepassword(dest))
+            base = None
         repo.ui.pushbuffer()
-        o = discovery.findoutgoing(repo, other)
+        o = discovery.findoutgoing(repo, other, base)
         repo.ui.popbuffer()
         o = repo.changelog.nodesbetween(o, None)[0]
         if o:
@@ -3703,9 +3893,10 @@ def tag(ui, repo, name1, *names, **opts):
     if opts.get('remove'):
         expectedtype = opts.get('local') and 'local' or 'global'
         for n in names:
-            if not repo.tagtype(n):
+            tagtype = repo.tagtype(n)
+            if not tagtype:
                 raise util.Abort(_('tag \'%s\' does not exist') % n)
-            if repo.tagtype(n) != expectedtype:
+            if tagtype != expectedtype:
                 if expectedtype == 'global':
                     raise util.Abort(_('tag \'%s\' is not a global tag') % n)
                 else:
@@ -3715,8 +3906,9 @@ def tag(ui, repo, name1, *names, **opts):
             # we don't translate commit messages
             message = 'Removed tag %s' % ', '.join(names)
     elif not opts.get('force'):
+        existing = repo.tags()
         for n in names:
-            if n in repo.tags():
+            if n in existing:
                 raise util.Abort(_('tag \'%s\' already exists '
                                    '(use -f to force)') % n)
     if not opts.get('local'):
@@ -3752,26 +3944,32 @@ def tags(ui, repo):
     """
 
     hexfunc = ui.debugflag and hex or short
-    tagtype = ""
+    tagslist = reversed(repo.tagslist())
 
-    for t, n in reversed(repo.tagslist()):
-        if ui.quiet:
-            ui.write("%s\n" % t)
-            continue
+    if ui.quiet:
+        ui.write("".join(["%s\n" % t for t, n in tagslist]))
+        return
 
+    rev = repo.changelog.rev
+    colwidth = encoding.colwidth
+    verbose = ui.verbose
+    tagtype = ""
+    out = []
+    for t, n in tagslist:
         try:
             hn = hexfunc(n)
-            r = "%5d:%s" % (repo.changelog.rev(n), hn)
+            r = "%5d:%s" % (rev(n), hn)
         except error.LookupError:
             r = "    ?:%s" % hn
         else:
-            spaces = " " * (30 - encoding.colwidth(t))
-            if ui.verbose:
+            spaces = " " * (30 - colwidth(t))
+            if verbose:
                 if repo.tagtype(t) == 'local':
                     tagtype = " local"
                 else:
                     tagtype = ""
-            ui.write("%s%s %s%s\n" % (t, spaces, r, tagtype))
+            out.append("%s%s %s%s\n" % (t, spaces, r, tagtype))
+    ui.write("".join(out))
 
 def tip(ui, repo, **opts):
     """show the tip revision
@@ -3881,7 +4079,7 @@ def update(ui, repo, node=None, rev=None, clean=False, date=None, check=False):
     else:
         return hg.update(repo, rev)
 
-def verify(ui, repo):
+def verify(ui, repo, **opts):
     """verify the integrity of the repository
 
     Verify the integrity of the current repository.
@@ -3891,9 +4089,11 @@ def verify(ui, repo):
     the changelog, manifest, and tracked files, as well as the
     integrity of their crosslinks and indices.
 
+    With --jobs, file revisions are unpacked and checked on N threads.
+
     Returns 0 on success, 1 if errors are encountered.
     """
-    return hg.verify(repo)
+    return hg.verify(repo, int(opts.get('jobs') or 0))
 
 def version_(ui):
     """output version and copyright information"""
@@ -4452,6 +4652,7 @@ table = {
           ('', 'pid-file', '',
            _('name of file to write process ID to'), _('FILE')),
           ('', 'stdio', None, _('for remote clients')),
+          ('', 'cmdserver', '', _('for remote clients'), _('MODE')),
           ('t', 'templates', '',
            _('web templates to use'), _('TEMPLATE')),
           ('', 'style', '',
@@ -4522,7 +4723,11 @@ table = {
           ('r', 'rev', '',
            _('revision'), _('REV'))],
          _('[-c] [-C] [-d DATE] [[-r] REV]')),
-    "verify": (verify, []),
+    "verify":
+        (verify,
+         [('j', 'jobs', 0,
+           _('check file revisions on N threads'), _('N'))],
+         _('[-j N]')),
     "version": (version_, []),
 }
 
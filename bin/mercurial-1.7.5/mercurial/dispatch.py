@@ -15,10 +15,17 @@ def run():
     "run the command in sys.argv"
     sys.exit(dispatch(sys.argv[1:]))
 
-def dispatch(args):
-    "run the command specified in args"
+def dispatch(args, repo=None):
+    """run the command specified in args
+
+    Commands that need a repository run against repo when it is given
+    and neither -R nor --cwd is used. Its baseui is used as global ui.
+    """
     try:
-        u = uimod.ui()
+        if repo is not None:
+            u = repo.baseui
+        else:
+            u = uimod.ui()
         if '--traceback' in args:
             u.setconfig('ui', 'traceback', 'on')
     except util.Abort, inst:
@@ -33,34 +40,47 @@ def dispatch(args):
         else:
             sys.stderr.write(_("hg: parse error: %s\n") % inst.args[0])
         return -1
-    return _runcatch(u, args)
+    return _runcatch(u, args, repo)
 
-def _runcatch(ui, args):
-    def catchterm(*args):
-        raise error.SignalInterrupt
+def _catchterm(*args):
+    raise error.SignalInterrupt
 
+_signalsinstalled = False
+def _installsignals():
+    """turn SIGBREAK, SIGHUP and SIGTERM into SignalInterrupt
+
+    The handlers stay in place, so this is done only once per process.
+    """
+    global _signalsinstalled
+    if _signalsinstalled:
+        return
     try:
         for name in 'SIGBREAK', 'SIGHUP', 'SIGTERM':
             num = getattr(signal, name, None)
             if num:
-                signal.signal(num, catchterm)
+                signal.signal(num, _catchterm)
+        _signalsinstalled = True
     except ValueError:
         pass # happens if called in a thread
 
+def _runcatch(ui, args, repo=None):
+    _installsignals()
+    debugger = '--debugger' in args
+
     try:
         try:
             # enter the debugger before command execution
-            if '--debugger' in args:
+            if debugger:
                 ui.warn(_("entering debugger - "
                         "type c to continue starting hg or h for help\n"))
                 pdb.set_trace()
             try:
-                return _dispatch(ui, args)
+                return _dispatch(ui, args, repo)
             finally:
                 ui.flush()
         except:
             # enter the debugger when we hit an exception
-            if '--debugger' in args:
+            if debugger:
                 traceback.print_exc()
                 pdb.post_mortem(sys.exc_info()[2])
             ui.traceback()
@@ -97,13 +117,14 @@ def _runcatch(ui, args):
     except error.RepoError, inst:
         ui.warn(_("abort: %s!\n") % inst)
     except error.ResponseError, inst:
-        ui.warn(_("abort: %s") % inst.args[0])
+        msg = _("abort: %s") % inst.args[0]
         if not isinstance(inst.args[1], basestring):
-            ui.warn(" %r\n" % (inst.args[1],))
+            msg += " %r\n" % (inst.args[1],)
         elif not inst.args[1]:
-            ui.warn(_(" empty string\n"))
+            msg += _(" empty string\n")
         else:
-            ui.warn("\n%r\n" % util.ellipsis(inst.args[1]))
+            msg += "\n%r\n" % util.ellipsis(inst.args[1])
+        ui.warn(msg)
     except error.RevlogError, inst:
         ui.warn(_("abort: %s!\n") % inst)
     except error.SignalInterrupt:
@@ -117,9 +138,10 @@ def _runcatch(ui, args):
         except error.UnknownCommand:
             commands.help_(ui, 'shortlist')
     except util.Abort, inst:
-        ui.warn(_("abort: %s\n") % inst)
+        msg = _("abort: %s\n") % inst
         if inst.hint:
-            ui.warn(_("(%s)\n") % inst.hint)
+            msg += _("(%s)\n") % inst.hint
+        ui.warn(msg)
     except ImportError, inst:
         ui.warn(_("abort: %s!\n") % inst)
         m = str(inst).split()[-1]
@@ -169,18 +191,39 @@ def _runcatch(ui, args):
     except socket.error, inst:
         ui.warn(_("abort: %s\n") % inst.args[-1])
     except:
+        # write the report in one go, stderr is unbuffered
         ui.warn(_("** unknown exception encountered,"
-                  " please report by visiting\n"))
-        ui.warn(_("**  http://mercurial.selenic.com/wiki/BugTracker\n"))
-        ui.warn(_("** Python %s\n") % sys.version.replace('\n', ''))
-        ui.warn(_("** Mercurial Distributed SCM (version %s)\n")
-               % util.version())
-        ui.warn(_("** Extensions loaded: %s\n")
-               % ", ".join([x[0] for x in extensions.extensions()]))
+                  " please report by visiting\n") +
+                _("**  http://mercurial.selenic.com/wiki/BugTracker\n") +
+                _("** Python %s\n") % sys.version.replace('\n', '') +
+                _("** Mercurial Distributed SCM (version %s)\n")
+                % util.version() +
+                _("** Extensions loaded: %s\n")
+                % ", ".join([x[0] for x in extensions.extensions()]))
         raise
 
     return -1
 
+# $0, $1, ..., $@ in shell alias definitions
+_shellargre = re.compile(r'\$(\d+|@)')
+
+# options that are handled before the command is looked up
+_earlyopts = ("--cwd", "-R", "--repository", "--repo")
+
+_cmdsets = {}
+def _cmdset(attr):
+    """Return the names in commands.norepo or commands.optionalrepo as a set
+
+    Extensions and aliases extend these strings by rebinding them, so the
+    set is rebuilt whenever the string is no longer the one it was made
+    from.
+    """
+    names = getattr(commands, attr)
+    cached = _cmdsets.get(attr)
+    if cached is None or cached[0] is not names:
+        cached = _cmdsets[attr] = (names, set(names.split()))
+    return cached[1]
+
 def aliasargs(fn):
     if hasattr(fn, 'args'):
         return fn.args
@@ -199,10 +242,10 @@ class cmdalias(object):
 
         try:
             aliases, entry = cmdutil.findcmd(self.name, cmdtable)
-            for alias, e in cmdtable.iteritems():
-                if e is entry:
-                    self.cmd = alias
-                    break
+            # the key of the shadowed command is made of its aliases
+            self.cmd = '|'.join(aliases)
+            if self.cmd not in cmdtable:
+                self.cmd = '^' + self.cmd
             self.shadows = True
         except error.UnknownCommand:
             self.shadows = False
@@ -220,16 +263,17 @@ class cmdalias(object):
             self.shell = True
             def fn(ui, *args):
                 env = {'HG_ARGS': ' '.join((self.name,) + args)}
-                def _checkvar(m):
-                    if int(m.groups()[0]) <= len(args):
-                        return m.group()
-                    else:
-                        return ''
-                cmd = re.sub(r'\$(\d+)', _checkvar, self.definition[1:])
-                replace = dict((str(i + 1), arg) for i, arg in enumerate(args))
-                replace['0'] = self.name
-                replace['@'] = ' '.join(args)
-                cmd = util.interpolate(r'\$', replace, cmd)
+                def _expandvar(m):
+                    var = m.group(1)
+                    if var == '@':
+                        return ' '.join(args)
+                    n = int(var)
+                    if not n:
+                        return self.name
+                    if n <= len(args):
+                        return args[n - 1]
+                    return ''
+                cmd = _shellargre.sub(_expandvar, self.definition[1:])
                 return util.system(cmd, environ=env)
             self.fn = fn
             return
@@ -238,7 +282,12 @@ class cmdalias(object):
         self.cmdname = cmd = args.pop(0)
         args = map(util.expandpath, args)
 
-        for invalidarg in ("--cwd", "-R", "--repository", "--repo"):
+        # a cheap scan first, most aliases have none of these options
+        if [a for a in args if a in _earlyopts or a.startswith('-R')]:
+            invalidargs = _earlyopts
+        else:
+            invalidargs = ()
+        for invalidarg in invalidargs:
             if _earlygetopt([invalidarg], args):
                 def fn(ui, *args):
                     ui.warn(_("error in definition for alias '%s': %s may only "
@@ -258,7 +307,7 @@ class cmdalias(object):
                 self.fn, self.opts = tableentry
 
             self.args = aliasargs(self.fn) + args
-            if cmd not in commands.norepo.split(' '):
+            if cmd not in _cmdset('norepo'):
                 self.norepo = False
             if self.help.startswith("hg " + cmd):
                 # drop prefix in old-style help lines so hg shows the alias
@@ -307,7 +356,7 @@ def addaliases(ui, cmdtable):
     for alias, definition in ui.configitems('alias'):
         aliasdef = cmdalias(alias, definition, cmdtable)
         cmdtable[aliasdef.cmd] = (aliasdef, aliasdef.opts, aliasdef.help)
-        if aliasdef.norepo:
+        if aliasdef.norepo and alias not in _cmdset('norepo'):
             commands.norepo += ' %s' % alias
 
 def _parse(ui, args):
@@ -334,8 +383,7 @@ def _parse(ui, args):
         c = []
 
     # combine global options into local
-    for o in commands.globalopts:
-        c.append((o[0], o[1], options[o[1]], o[3]))
+    c.extend([(o[0], o[1], options[o[1]], o[3]) for o in commands.globalopts])
 
     try:
         args = fancyopts.fancyopts(args, c, cmdoptions, True)
@@ -344,9 +392,7 @@ def _parse(ui, args):
 
     # separate global options back out
     for o in commands.globalopts:
-        n = o[1]
-        options[n] = cmdoptions[n]
-        del cmdoptions[n]
+        options[o[1]] = cmdoptions.pop(o[1])
 
     return (cmd, cmd and entry[0] or None, args, options, cmdoptions)
 
@@ -375,32 +421,38 @@ def _earlygetopt(aliases, args):
         argcount = len(args)
     shortopts = [opt for opt in aliases if len(opt) == 2]
     values = []
+    keep = []
     pos = 0
     while pos < argcount:
-        if args[pos] in aliases:
+        arg = args[pos]
+        if arg in aliases:
             if pos + 1 >= argcount:
                 # ignore and let getopt report an error if there is no value
                 break
-            del args[pos]
-            values.append(args.pop(pos))
-            argcount -= 2
-        elif args[pos][:2] in shortopts:
+            values.append(args[pos + 1])
+            pos += 2
+        elif arg[:2] in shortopts:
             # short option can have no following space, e.g. hg log -Rfoo
-            values.append(args.pop(pos)[2:])
-            argcount -= 1
+            values.append(arg[2:])
+            pos += 1
         else:
+            keep.append(arg)
             pos += 1
+    if values:
+        # rebuild args once instead of shifting it for every option
+        args[:] = keep + args[pos:]
     return values
 
 def runcommand(lui, repo, cmd, fullargs, ui, options, d, cmdpats, cmdoptions):
     # run pre-hook, and abort if it fails
-    ret = hook.hook(lui, repo, "pre-%s" % cmd, False, args=" ".join(fullargs),
+    hookargs = " ".join(fullargs)
+    ret = hook.hook(lui, repo, "pre-%s" % cmd, False, args=hookargs,
                     pats=cmdpats, opts=cmdoptions)
     if ret:
         return ret
     ret = _runcommand(ui, options, cmd, d)
     # run post-hook, passing command result
-    hook.hook(lui, repo, "post-%s" % cmd, False, args=" ".join(fullargs),
+    hook.hook(lui, repo, "post-%s" % cmd, False, args=hookargs,
               result=ret, pats=cmdpats, opts=cmdoptions)
     return ret
 
@@ -447,6 +499,14 @@ def _checkshellalias(ui, args):
 
     path, lui = _getlocal(ui, [options['repository']])
 
+    # without any shell alias there is no need to build the alias table
+    for name, definition in lui.configitems('alias'):
+        if definition.startswith('!'):
+            break
+    else:
+        os.chdir(cwd)
+        return
+
     cmdtable = commands.table.copy()
     addaliases(lui, cmdtable)
 
@@ -469,14 +529,23 @@ def _checkshellalias(ui, args):
     os.chdir(cwd)
 
 _loaded = set()
-def _dispatch(ui, args):
+_printtime = []
+def _dispatch(ui, args, openrepo=None):
     shellaliasfn = _checkshellalias(ui, args)
     if shellaliasfn:
         return shellaliasfn()
 
+    # settings from the command line also go to the ui of a repository
+    # opened by the caller
+    uis = [ui]
+    if openrepo is not None:
+        uis.append(openrepo.ui)
+
     # read --config before doing anything else
     # (e.g. to change trust settings for reading .hg/hgrc)
-    _parseconfig(ui, _earlygetopt(['--config'], args))
+    config = _earlygetopt(['--config'], args)
+    for ui_ in uis:
+        _parseconfig(ui_, config)
 
     # check for cwd
     cwd = _earlygetopt(['--cwd'], args)
@@ -484,7 +553,12 @@ def _dispatch(ui, args):
         os.chdir(cwd[-1])
 
     rpath = _earlygetopt(["-R", "--repository", "--repo"], args)
-    path, lui = _getlocal(ui, rpath)
+    if openrepo is not None and not rpath and not cwd:
+        # the repository opened by the caller already read its hgrc
+        path, lui = openrepo.root, openrepo.ui
+    else:
+        openrepo = None
+        path, lui = _getlocal(ui, rpath)
 
     # Configure extensions in phases: uisetup, extsetup, cmdtable, and
     # reposetup. Programs like TortoiseHg will call _dispatch several
@@ -505,7 +579,13 @@ def _dispatch(ui, args):
         commands.table.update(cmdtable)
         _loaded.add(name)
 
-    # (reposetup is handled in hg.repository)
+    # (reposetup is handled in hg.repository, a repository opened by the
+    # caller missed it for extensions loaded just now)
+    if openrepo is not None:
+        for name, module in exts:
+            reposetup = getattr(module, 'reposetup', None)
+            if reposetup:
+                reposetup(openrepo.ui, openrepo)
 
     addaliases(lui, commands.table)
 
@@ -541,19 +621,24 @@ def _dispatch(ui, args):
             t = get_times()
             ui.warn(_("Time: real %.3f secs (user %.3f+%.3f sys %.3f+%.3f)\n") %
                 (t[4]-s[4], t[0]-s[0], t[2]-s[2], t[1]-s[1], t[3]-s[3]))
-        atexit.register(print_time)
-
-    if options['verbose'] or options['debug'] or options['quiet']:
-        ui.setconfig('ui', 'verbose', str(bool(options['verbose'])))
-        ui.setconfig('ui', 'debug', str(bool(options['debug'])))
-        ui.setconfig('ui', 'quiet', str(bool(options['quiet'])))
-    if options['traceback']:
-        ui.setconfig('ui', 'traceback', 'on')
-    if options['noninteractive']:
-        ui.setconfig('ui', 'interactive', 'off')
-
-    if cmdoptions.get('insecure', False):
-        ui.setconfig('web', 'cacerts', '')
+        # register once, processes dispatching many commands would pile
+        # up one callback per command otherwise
+        if not _printtime:
+            atexit.register(lambda: _printtime[0]())
+        _printtime[:] = [print_time]
+
+    for ui_ in uis:
+        if options['verbose'] or options['debug'] or options['quiet']:
+            ui_.setconfig('ui', 'verbose', str(bool(options['verbose'])))
+            ui_.setconfig('ui', 'debug', str(bool(options['debug'])))
+            ui_.setconfig('ui', 'quiet', str(bool(options['quiet'])))
+        if options['traceback']:
+            ui_.setconfig('ui', 'traceback', 'on')
+        if options['noninteractive']:
+            ui_.setconfig('ui', 'interactive', 'off')
+
+        if cmdoptions.get('insecure', False):
+            ui_.setconfig('web', 'cacerts', '')
 
     if options['help']:
         return commands.help_(ui, cmd, options['version'])
@@ -564,15 +649,17 @@ def _dispatch(ui, args):
 
     repo = None
     cmdpats = args[:]
-    if cmd not in commands.norepo.split():
+    if cmd not in _cmdset('norepo'):
+        repo = openrepo
         try:
-            repo = hg.repository(ui, path=path)
+            if repo is None:
+                repo = hg.repository(ui, path=path)
             ui = repo.ui
             if not repo.local():
                 raise util.Abort(_("repository '%s' is not local") % path)
             ui.setconfig("bundle", "mainreporoot", repo.root)
         except error.RepoError:
-            if cmd not in commands.optionalrepo.split():
+            if cmd not in _cmdset('optionalrepo'):
                 if args and not path: # try to infer -R from command args
                     repos = map(cmdutil.findrepo, args)
                     guess = repos[0]
@@ -92,6 +92,12 @@ ambiguous = os.environ.get("HGENCODINGAMBIGUOUS", "narrow")
 
 def colwidth(s):
     "Find the column width of a UTF-8 string for display"
+    try:
+        # plain ASCII is one column per byte
+        s.decode('ascii')
+        return len(s)
+    except UnicodeError:
+        pass
     d = s.decode(encoding, 'replace')
     if hasattr(unicodedata, 'east_asian_width'):
         wide = "WF"
@@ -522,9 +522,9 @@ def revert(repo, node, choose):
     """revert changes to revision in node without updating dirstate"""
     return mergemod.update(repo, node, False, True, choose)[3] > 0
 
-def verify(repo):
+def verify(repo, jobs=0):
     """verify the consistency of a repository"""
-    return verifymod.verify(repo)
+    return verifymod.verify(repo, jobs)
 
 def remoteui(src, opts):
     'build a remote ui from ui or repo and opts'
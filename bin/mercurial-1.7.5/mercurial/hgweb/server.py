@@ -37,6 +37,10 @@ class _httprequesthandler(BaseHTTPServer.BaseHTTPRequestHandler):
 
     url_scheme = 'http'
 
+    # buffer output instead of sending the status line, each header and
+    # each chunk of the response in a packet of their own
+    wbufsize = 64 * 1024
+
     @staticmethod
     def preparehttpserver(httpserver, ssl_cert):
         """Prepare .socket of new HTTPServer instance"""
@@ -126,6 +130,8 @@ class _httprequesthandler(BaseHTTPServer.BaseHTTPRequestHandler):
         self.length = None
         for chunk in self.server.application(env, self._start_response):
             self._write(chunk)
+        # the connection may be kept open, send what is still buffered
+        self.wfile.flush()
 
     def send_headers(self):
         if not self.saved_status:
@@ -171,7 +177,6 @@ class _httprequesthandler(BaseHTTPServer.BaseHTTPRequestHandler):
                                      "bytes than specified are being written.")
             self.length = self.length - len(data)
         self.wfile.write(data)
-        self.wfile.flush()
 
 class _httprequesthandleropenssl(_httprequesthandler):
     """HTTPS handler based on pyOpenSSL"""
@@ -234,9 +239,23 @@ class _httprequesthandlerssl(_httprequesthandler):
         self.rfile = socket._fileobject(self.request, "rb", self.rbufsize)
         self.wfile = socket._fileobject(self.request, "wb", self.wbufsize)
 
+class _poolmixin(SocketServer.ThreadingMixIn):
+    """serve requests on a fixed number of threads when workers is set,
+    instead of starting a new thread for every request"""
+    workers = 0
+    _pool = None
+
+    def process_request(self, request, client_address):
+        if not self.workers:
+            return SocketServer.ThreadingMixIn.process_request(
+                self, request, client_address)
+        if self._pool is None:
+            self._pool = util.threadpool(self.workers)
+        self._pool.submit(self.process_request_thread, request, client_address)
+
 try:
     from threading import activeCount
-    _mixin = SocketServer.ThreadingMixIn
+    _mixin = _poolmixin
 except ImportError:
     if hasattr(os, "fork"):
         _mixin = SocketServer.ForkingMixIn
@@ -256,9 +275,15 @@ class MercurialHTTPServer(object, _mixin, BaseHTTPServer.HTTPServer):
         allow_reuse_address = 0
 
     def __init__(self, ui, app, addr, handler, **kwargs):
+        try:
+            workers = int(ui.config('web', 'workers', 0))
+        except ValueError:
+            raise util.Abort(_('web.workers must be an integer'))
+
         BaseHTTPServer.HTTPServer.__init__(self, addr, handler, **kwargs)
         self.daemon_threads = True
         self.application = app
+        self.workers = workers
 
         handler.preparehttpserver(self, ui.config('web', 'certificate'))
 
@@ -274,6 +299,45 @@ class MercurialHTTPServer(object, _mixin, BaseHTTPServer.HTTPServer):
 
         self.addr, self.port = self.socket.getsockname()[0:2]
         self.fqaddr = socket.getfqdn(addr[0])
+        # SSL sockets handshake in accept(), they must stay blocking;
+        # Python before 2.6 accepts without waiting in select() first
+        self._drain = (not ui.config('web', 'certificate') and
+                       hasattr(SocketServer.BaseServer,
+                               '_handle_request_noblock'))
+        if self._drain:
+            self.socket.setblocking(0)
+
+    def _handle_request_noblock(self):
+        """accept every connection already queued
+
+        serve_forever calls this once the listening socket is readable,
+        so a burst of connections costs one wakeup instead of one each.
+        """
+        if not self._drain:
+            return BaseHTTPServer.HTTPServer._handle_request_noblock(self)
+        timeout = socket.getdefaulttimeout()
+        while True:
+            try:
+                request, client_address = self.get_request()
+            except socket.error, inst:
+                if inst.args[0] == errno.EINTR:
+                    continue
+                if inst.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    # the backlog is empty
+                    return
+                # the socket stays readable on errors such as EMFILE,
+                # going back to select() would spin
+                raise
+            # some platforms let accepted sockets inherit non-blocking mode
+            request.settimeout(timeout)
+            if self.verify_request(request, client_address):
+                try:
+                    self.process_request(request, client_address)
+                except:
+                    self.handle_error(request, client_address)
+                    self.close_request(request)
+            else:
+                self.close_request(request)
 
 class IPv6HTTPServer(MercurialHTTPServer):
     address_family = getattr(socket, 'AF_INET6', None)
@@ -21,6 +21,15 @@ for dir in ('.', '..'):
         break
 
 t = gettext.translation('hg', localedir, fallback=True)
+# without a catalog for the current language every message is its own
+# translation, the hundreds of messages looked up when the command table
+# is built at import time need not go through the catalog then
+_translating = t.__class__ is not gettext.NullTranslations
+
+# translations already made, by local encoding. Metavars such as REV
+# and FILE and the common option descriptions recur throughout the
+# command table and are looked up once each.
+_cache = {}
 
 def gettext(message):
     """Translate message.
@@ -33,13 +42,24 @@ def gettext(message):
     """
     # If message is None, t.ugettext will return u'None' as the
     # translation whereas our callers expect us to return None.
-    if message is None:
+    if message is None or not _translating:
         return message
 
-    paragraphs = message.split('\n\n')
+    cache = _cache.setdefault(encoding.encoding, {})
+    if message not in cache:
+        cache[message] = _translate(message)
+    return cache[message]
+
+def _translate(message):
     # Be careful not to translate the empty string -- it holds the
     # meta data of the .po file.
-    u = u'\n\n'.join([p and t.ugettext(p) or '' for p in paragraphs])
+    if '\n\n' not in message:
+        # option help and synopses in the command table are built at
+        # import time and are all single paragraphs
+        u = message and t.ugettext(message) or u''
+    else:
+        paragraphs = message.split('\n\n')
+        u = u'\n\n'.join([p and t.ugettext(p) or '' for p in paragraphs])
     try:
         # encoding.tolocal cannot be used since it will first try to
         # decode the Unicode string. Calling u.decode(enc) really
@@ -51,7 +71,7 @@ def gettext(message):
         # An unknown encoding results in a LookupError.
         return message
 
-if 'HGPLAIN' in os.environ:
+if 'HGPLAIN' in os.environ or not _translating:
     _ = lambda message: message
 else:
     _ = gettext
@@ -500,10 +500,12 @@ class localrepository(repo.repository):
         n = self.changelog._match(key)
         if n:
             return n
-        if key in self.tags():
-            return self.tags()[key]
-        if key in self.branchtags():
-            return self.branchtags()[key]
+        tags = self.tags()
+        if key in tags:
+            return tags[key]
+        branches = self.branchtags()
+        if key in branches:
+            return branches[key]
         n = self.changelog._partialmatch(key)
         if n:
             return n
@@ -723,6 +725,12 @@ class localrepository(repo.repository):
         self._branchcache = None # in UTF-8
         self._branchcachetip = None
 
+    def invalidatedirstate(self):
+        """drop the dirstate, it is read again with the current ui on
+        next access"""
+        if 'dirstate' in self.__dict__:
+            delattr(self, 'dirstate')
+
     def invalidate(self):
         for a in "changelog manifest".split():
             if a in self.__dict__:
@@ -17,7 +17,7 @@ from i18n import _
 import error, osutil, encoding
 import errno, re, shutil, sys, tempfile, traceback
 import os, stat, time, calendar, textwrap, unicodedata, signal
-import imp, socket
+import imp, socket, threading, Queue
 
 # Python compatibility
 
@@ -170,6 +170,79 @@ class propertycache(object):
         setattr(obj, self.name, result)
         return result
 
+def cpucount():
+    '''return the number of online processors (at least 1)'''
+    try:
+        n = int(os.sysconf('SC_NPROCESSORS_ONLN'))
+    except (AttributeError, ValueError, OSError):
+        try:
+            n = int(os.environ.get('NUMBER_OF_PROCESSORS', 1))
+        except ValueError:
+            n = 1
+    return max(n, 1)
+
+class pooltask(object):
+    '''pending result of a call queued on a threadpool'''
+    def __init__(self, func, args):
+        self._func = func
+        self._args = args
+        self._done = threading.Event()
+        self._result = None
+        self._exc = None
+
+    def run(self):
+        try:
+            try:
+                self._result = self._func(*self._args)
+            except:
+                self._exc = sys.exc_info()
+        finally:
+            self._func = self._args = None
+            self._done.set()
+
+    def result(self):
+        '''wait for the call to finish and return its value'''
+        self._done.wait()
+        if self._exc:
+            raise self._exc[0], self._exc[1], self._exc[2]
+        return self._result
+
+class threadpool(object):
+    '''run function calls on a fixed set of daemon threads
+
+    Tasks start in submission order. Only hand over work that does not
+    touch shared mutable state such as revlogs or the dirstate.
+    '''
+    def __init__(self, workers=None):
+        self._queue = Queue.Queue()
+        self._threads = []
+        for i in xrange(workers or cpucount()):
+            t = threading.Thread(target=self._work)
+            t.setDaemon(True)
+            t.start()
+            self._threads.append(t)
+
+    def _work(self):
+        while True:
+            task = self._queue.get()
+            if task is None:
+                return
+            task.run()
+
+    def submit(self, func, *args):
+        '''queue func(*args) and return its pooltask'''
+        task = pooltask(func, args)
+        self._queue.put(task)
+        return task
+
+    def close(self):
+        '''let queued tasks finish and stop the worker threads'''
+        for t in self._threads:
+            self._queue.put(None)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
 def pipefilter(s, cmd):
     '''filter string S through command CMD, returning its output'''
     p = subprocess.Popen(cmd, shell=True, close_fds=closefds,
@@ -450,11 +523,34 @@ def copyfile(src, dest):
         os.symlink(os.readlink(src), dest)
     else:
         try:
-            shutil.copyfile(src, dest)
+            _copyfiledata(src, dest)
             shutil.copystat(src, dest)
         except shutil.Error, inst:
             raise Abort(str(inst))
 
+def _copyfiledata(src, dest, size=1 << 20):
+    """copy the contents of src to dest, size bytes at a time
+
+    Like shutil.copyfile, but with a buffer large enough that big files
+    take few read and write calls."""
+    if os.path.exists(dest):
+        if hasattr(os.path, 'samefile'):
+            same = os.path.samefile(src, dest)
+        else:
+            same = (os.path.normcase(os.path.abspath(src)) ==
+                    os.path.normcase(os.path.abspath(dest)))
+        if same:
+            raise shutil.Error("`%s` and `%s` are the same file" % (src, dest))
+    fsrc = open(src, 'rb')
+    try:
+        fdst = open(dest, 'wb')
+        try:
+            shutil.copyfileobj(fsrc, fdst, size)
+        finally:
+            fdst.close()
+    finally:
+        fsrc.close()
+
 def copyfiles(src, dst, hardlink=None):
     """Copy a directory tree using hardlinks if possible"""
 
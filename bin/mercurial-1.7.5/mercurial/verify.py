@@ -10,14 +10,14 @@ from i18n import _
 import os
 import revlog, util, error
 
-def verify(repo):
+def verify(repo, jobs=0):
     lock = repo.lock()
     try:
-        return _verify(repo)
+        return _verify(repo, jobs)
     finally:
         lock.release()
 
-def _verify(repo):
+def _verify(repo, jobs=0):
     mflinkrevs = {}
     filelinkrevs = {}
     filenodes = {}
@@ -73,6 +73,18 @@ def _verify(repo):
         elif revlogv1:
             warn(_("warning: `%s' uses revlog format 0") % name)
 
+    def readrevs(f):
+        # runs on a worker thread, with a filelog of its own
+        fl = repo.file(f)
+        revs = []
+        for i in fl:
+            n = fl.node(i)
+            try:
+                revs.append((len(fl.read(n)), fl.renamed(n)))
+            except Exception, inst:
+                revs.append(inst)
+        return revs
+
     def checkentry(obj, i, node, seen, linkrevs, f):
         lr = obj.linkrev(obj.rev(node))
         if lr < 0 or (havecl and lr not in linkrevs):
@@ -204,86 +216,121 @@ def _verify(repo):
 
     files = sorted(set(filenodes) | set(filelinkrevs))
     total = len(files)
-    for i, f in enumerate(files):
-        ui.progress(_('checking'), i, item=f, total=total)
-        try:
-            linkrevs = filelinkrevs[f]
-        except KeyError:
-            # in manifest but not in changelog
-            linkrevs = []
-
-        if linkrevs:
-            lr = linkrevs[0]
-        else:
-            lr = None
-
-        try:
-            fl = repo.file(f)
-        except error.RevlogError, e:
-            err(lr, _("broken revlog! (%s)") % e, f)
-            continue
 
-        for ff in fl.files():
+    # unpacking and hashing every file revision is the bulk of the work,
+    # let worker threads read ahead while the checks below run in order;
+    # only a few files ahead, the results are held until checked
+    pool = None
+    if jobs > 1:
+        pool = util.threadpool(jobs)
+    try:
+        if pool:
+            window = jobs * 2
+            reads = {}
+            for f in files[:window]:
+                reads[f] = pool.submit(readrevs, f)
+        for i, f in enumerate(files):
+            ui.progress(_('checking'), i, item=f, total=total)
+            if pool:
+                read = reads.pop(f)
+                if i + window < total:
+                    nf = files[i + window]
+                    reads[nf] = pool.submit(readrevs, nf)
             try:
-                storefiles.remove(ff)
+                linkrevs = filelinkrevs[f]
             except KeyError:
-                err(lr, _("missing revlog!"), ff)
+                # in manifest but not in changelog
+                linkrevs = []
 
-        checklog(fl, f, lr)
-        seen = {}
-        rp = None
-        for i in fl:
-            revisions += 1
-            n = fl.node(i)
-            lr = checkentry(fl, i, n, seen, linkrevs, f)
-            if f in filenodes:
-                if havemf and n not in filenodes[f]:
-                    err(lr, _("%s not in manifests") % (short(n)), f)
-                else:
-                    del filenodes[f][n]
+            if linkrevs:
+                lr = linkrevs[0]
+            else:
+                lr = None
 
-            # verify contents
             try:
-                l = len(fl.read(n))
-                rp = fl.renamed(n)
-                if l != fl.size(i):
-                    if len(fl.revision(n)) != fl.size(i):
-                        err(lr, _("unpacked size is %s, %s expected") %
-                            (l, fl.size(i)), f)
-            except Exception, inst:
-                exc(lr, _("unpacking %s") % short(n), inst, f)
+                fl = repo.file(f)
+            except error.RevlogError, e:
+                err(lr, _("broken revlog! (%s)") % e, f)
+                continue
 
-            # check renames
-            try:
-                if rp:
-                    if lr is not None and ui.verbose:
-                        ctx = lrugetctx(lr)
-                        found = False
-                        for pctx in ctx.parents():
-                            if rp[0] in pctx:
-                                found = True
-                                break
-                        if not found:
-                            warn(_("warning: copy source of '%s' not"
-                                   " in parents of %s") % (f, ctx))
-                    fl2 = repo.file(rp[0])
-                    if not len(fl2):
-                        err(lr, _("empty or missing copy source revlog %s:%s")
-                            % (rp[0], short(rp[1])), f)
-                    elif rp[1] == nullid:
-                        ui.note(_("warning: %s@%s: copy source"
-                                  " revision is nullid %s:%s\n")
-                            % (f, lr, rp[0], short(rp[1])))
+            for ff in fl.files():
+                try:
+                    storefiles.remove(ff)
+                except KeyError:
+                    err(lr, _("missing revlog!"), ff)
+
+            checklog(fl, f, lr)
+            revs = None
+            if pool:
+                try:
+                    revs = read.result()
+                except Exception:
+                    pass
+                if revs is not None and len(revs) != len(fl):
+                    revs = None
+            seen = {}
+            rp = None
+            for i in fl:
+                revisions += 1
+                n = fl.node(i)
+                lr = checkentry(fl, i, n, seen, linkrevs, f)
+                if f in filenodes:
+                    if havemf and n not in filenodes[f]:
+                        err(lr, _("%s not in manifests") % (short(n)), f)
                     else:
-                        fl2.rev(rp[1])
-            except Exception, inst:
-                exc(lr, _("checking rename of %s") % short(n), inst, f)
+                        del filenodes[f][n]
 
-        # cross-check
-        if f in filenodes:
-            fns = [(lr, n) for n, lr in filenodes[f].iteritems()]
-            for lr, node in sorted(fns):
-                err(lr, _("%s in manifests not found") % short(node), f)
+                # verify contents
+                try:
+                    if revs is None:
+                        l = len(fl.read(n))
+                        rp = fl.renamed(n)
+                    elif isinstance(revs[i], Exception):
+                        raise revs[i]
+                    else:
+                        l, rp = revs[i]
+                    if l != fl.size(i):
+                        if len(fl.revision(n)) != fl.size(i):
+                            err(lr, _("unpacked size is %s, %s expected") %
+                                (l, fl.size(i)), f)
+                except Exception, inst:
+                    exc(lr, _("unpacking %s") % short(n), inst, f)
+
+                # check renames
+                try:
+                    if rp:
+                        if lr is not None and ui.verbose:
+                            ctx = lrugetctx(lr)
+                            found = False
+                            for pctx in ctx.parents():
+                                if rp[0] in pctx:
+                                    found = True
+                                    break
+                            if not found:
+                                warn(_("warning: copy source of '%s' not"
+                                       " in parents of %s") % (f, ctx))
+                        fl2 = repo.file(rp[0])
+                        if not len(fl2):
+                            err(lr, _("empty or missing copy source "
+                                      "revlog %s:%s")
+                                % (rp[0], short(rp[1])), f)
+                        elif rp[1] == nullid:
+                            ui.note(_("warning: %s@%s: copy source"
+                                      " revision is nullid %s:%s\n")
+                                % (f, lr, rp[0], short(rp[1])))
+                        else:
+                            fl2.rev(rp[1])
+                except Exception, inst:
+                    exc(lr, _("checking rename of %s") % short(n), inst, f)
+
+            # cross-check
+            if f in filenodes:
+                fns = [(lr, n) for n, lr in filenodes[f].iteritems()]
+                for lr, node in sorted(fns):
+                    err(lr, _("%s in manifests not found") % short(node), f)
+    finally:
+        if pool:
+            pool.close()
     ui.progress(_('checking'), None)
 
     for f in storefiles:
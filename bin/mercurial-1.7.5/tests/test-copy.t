@@ -12,6 +12,11 @@
   branch: default
   commit: 1 copied
   update: (current)
+  $ echo c > c
+  $ hg -q sum
+  parent: 0:c19d34741b0a tip
+  commit: 1 copied, 1 unknown
+  $ rm c
   $ hg --debug commit -m "2"
   b
    b: copy a:b789fdd96dc2f3bd229c1dd8eedf0fc60e2b68e3
@@ -89,3 +94,10 @@ this should show the rename information in the metadata
   crosschecking files in changesets and manifests
   checking files
   2 files, 2 changesets, 2 total revisions
+
+summary counts the changesets an update would bring in
+
+  $ hg up -q 0
+  $ hg sum -q
+  parent: 0:c19d34741b0a 
+  update: 1 new changesets (update)
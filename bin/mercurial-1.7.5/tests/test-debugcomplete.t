@@ -128,6 +128,7 @@ Show the options for the "serve" command
   --accesslog
   --address
   --certificate
+  --cmdserver
   --config
   --cwd
   --daemon
@@ -190,7 +191,7 @@ Show all commands + options
   pull: update, force, rev, branch, ssh, remotecmd, insecure
   push: force, rev, branch, new-branch, ssh, remotecmd, insecure
   remove: after, force, include, exclude
-  serve: accesslog, daemon, daemon-pipefds, errorlog, port, address, prefix, name, web-conf, webdir-conf, pid-file, stdio, templates, style, ipv6, certificate
+  serve: accesslog, daemon, daemon-pipefds, errorlog, port, address, prefix, name, web-conf, webdir-conf, pid-file, stdio, cmdserver, templates, style, ipv6, certificate
   status: all, modified, added, removed, deleted, clean, unknown, ignored, no-status, copies, print0, rev, change, include, exclude, subrepos
   summary: remote
   update: clean, check, date, rev
@@ -245,5 +246,5 @@ Show all commands + options
   tags: 
   tip: patch, git, style, template
   unbundle: update
-  verify: 
+  verify: jobs
   version: 
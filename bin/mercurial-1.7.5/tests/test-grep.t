@@ -50,6 +50,19 @@ all
   port:1:2:+:eggs:export
   port:0:1:+:spam:import
 
+all, walking forward
+
+  $ hg grep --all -n -r 0:tip port port
+  port:0:1:+:import
+  port:1:2:+:export
+  port:2:1:-:import
+  port:2:2:-:export
+  port:2:1:+:export
+  port:2:2:+:vaportight
+  port:2:3:+:import/export
+  port:3:4:+:import/export
+  port:4:4:-:import/export
+
 other
 
   $ hg grep import port
@@ -420,21 +420,16 @@ Test ambiguous command help
 
 Test command without options
 
-  $ hg help verify
-  hg verify
+  $ hg help root
+  hg root
   
-  verify the integrity of the repository
+  print the root (top) of the current working directory
   
-      Verify the integrity of the current repository.
+      Print the root directory of the current repository.
   
-      This will perform an extensive check of the repository's integrity,
-      validating the hashes and checksums of each entry in the changelog,
-      manifest, and tracked files, as well as the integrity of their crosslinks
-      and indices.
-  
-      Returns 0 on success, 1 if errors are encountered.
+      Returns 0 on success.
   
-  use "hg -v help verify" to show global options
+  use "hg -v help root" to show global options
 
   $ hg help diff
   hg diff [OPTION]... ([-c REV] | [-r REV1 [-r REV2]]) [FILE]...
@@ -466,3 +466,24 @@ limit to 3 changesets
   date:        Thu Jan 01 00:00:00 1970 +0000
   summary:     11
   
+
+summary compares with a default path serving both directions only once
+
+  $ cd ..
+  $ hg init sa
+  $ echo a > sa/a
+  $ hg -R sa ci -Aqm0
+  $ hg clone -q sa sb
+  $ echo b >> sa/a
+  $ hg -R sa ci -qm1
+  $ echo c >> sb/a
+  $ hg -R sb ci -qm2
+  $ cd sb
+  $ hg summary --remote --debug | grep 'comparing\|remote'
+  comparing with */sa (glob)
+  remote: 1 or more incoming, 1 outgoing
+  $ echo "default-push = `pwd`/../sa" >> .hg/hgrc
+  $ hg summary --remote --debug | grep 'comparing\|remote'
+  comparing with */sa (glob)
+  comparing with */sb/../sa (glob)
+  remote: 1 or more incoming, 1 outgoing
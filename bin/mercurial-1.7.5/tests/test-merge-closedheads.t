@@ -73,6 +73,10 @@ hg commit
 hg commit --close-branch
   $ hgcommit --close-branch -m 'closed some-branch'
 
+summary reports the closed head
+  $ hg summary | grep commit
+  commit: (head closed)
+
 hg update default
   $ hg update default
   1 files updated, 0 files merged, 0 files removed, 0 files unresolved
@@ -150,3 +150,12 @@ merge working dir with 1 parent, hg parents c
   date:        Thu Jan 01 00:00:04 1970 +0000
   summary:     c2
   
+
+merge working dir with 1 parent, file unchanged in both parents
+
+  $ hg parents a
+  changeset:   1:d786049f033a
+  user:        test
+  date:        Thu Jan 01 00:00:01 1970 +0000
+  summary:     a
+  
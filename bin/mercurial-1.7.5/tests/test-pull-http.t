@@ -44,3 +44,23 @@ expect error, pulling not allowed
   searching for changes
   abort: authorization failed
   % serve errors
+
+pulling from a server with a fixed number of worker threads
+
+  $ echo '[web]' > .hg/hgrc
+  $ echo 'workers = 2' >> .hg/hgrc
+  $ req
+  pulling from http://localhost:$HGPORT/
+  searching for changes
+  adding changesets
+  adding manifests
+  adding file changes
+  added 1 changesets with 1 changes to 1 files
+  (run 'hg update' to get a working copy)
+  % serve errors
+
+a worker count that is not a number
+
+  $ hg serve -p $HGPORT --config web.workers=two
+  abort: web.workers must be an integer
+  [255]
@@ -26,6 +26,9 @@ failing merge
   use 'hg resolve' to retry unresolved file merges or 'hg update -C .' to abandon
   [1]
 
+  $ hg summary | grep commit
+  commit: 1 modified, 1 unresolved (merge)
+
   $ echo resolved > file
   $ hg resolve -m file
   $ hg commit -m 'resolved'
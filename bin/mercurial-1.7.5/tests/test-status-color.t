@@ -18,6 +18,17 @@ hg status in repo root:
   \x1b[0;35;1;4m? b/in_b\x1b[0m (esc)
   \x1b[0;35;1;4m? in_root\x1b[0m (esc)
 
+hg status --print0 piped with --color=always:
+
+  $ hg status --color=always --print0 | tr '\000' '\n'
+  \x1b[0;35;1;4m? a/1/in_a_1 (esc)
+  \x1b[0m\x1b[0;35;1;4m? a/in_a (esc)
+  \x1b[0m\x1b[0;35;1;4m? b/1/in_b_1 (esc)
+  \x1b[0m\x1b[0;35;1;4m? b/2/in_b_2 (esc)
+  \x1b[0m\x1b[0;35;1;4m? b/in_b (esc)
+  \x1b[0m\x1b[0;35;1;4m? in_root (esc)
+  \x1b[0m (no-eol) (esc)
+
 hg status . in repo root:
 
   $ hg status --color=always .
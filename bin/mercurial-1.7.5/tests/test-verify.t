@@ -99,3 +99,23 @@ test revlog format 0
   crosschecking files in changesets and manifests
   checking files
   1 files, 1 changesets, 1 total revisions
+
+  $ cd ..
+
+verify on worker threads
+
+  $ hg init c
+  $ cd c
+  $ echo a > a
+  $ echo b > b
+  $ for f in d e f g; do echo $f > $f; done
+  $ hg ci -Aqm0
+  $ hg cp a c
+  $ echo b >> b
+  $ hg ci -qm1
+  $ hg verify -j 2
+  checking changesets
+  checking manifests
+  crosschecking files in changesets and manifests
+  checking files
+  7 files, 2 changesets, 8 total revisions